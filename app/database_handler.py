@@ -1,9 +1,11 @@
 import os
 import sqlite3
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_batch
 from datetime import datetime
 
+from profiler import timed
+
 
 class DatabaseManager:
     def __init__(self):
@@ -63,13 +65,9 @@ class DatabaseManager:
         conn.commit()
         conn.close()
 
-    def save_score(self, user_id, chat_id, username, first_name, last_name, score, is_winner=False):
-        conn = self._get_conn()
-        cur = conn.cursor()
-        win_inc = 1 if is_winner else 0
-
+    def _upsert_score_sql(self):
         if self.mode == "sqlite":
-            cur.execute('''
+            return '''
                 INSERT INTO scores (user_id, chat_id, username, first_name, last_name, total_score, games_played, wins, last_updated)
                 VALUES (?, ?, ?, ?, ?, ?, 1, ?, datetime('now'))
                 ON CONFLICT(user_id, chat_id) DO UPDATE SET
@@ -80,9 +78,9 @@ class DatabaseManager:
                     games_played=scores.games_played + 1,
                     wins=scores.wins + excluded.wins,
                     last_updated=datetime('now')
-            ''', (user_id, chat_id, username, first_name, last_name, score, win_inc))
+            '''
         else:
-            cur.execute('''
+            return '''
                 INSERT INTO scores (user_id, chat_id, username, first_name, last_name, total_score, games_played, wins, last_updated)
                 VALUES (%s, %s, %s, %s, %s, %s, 1, %s, CURRENT_TIMESTAMP)
                 ON CONFLICT (user_id, chat_id) DO UPDATE
@@ -93,11 +91,47 @@ class DatabaseManager:
                         games_played = scores.games_played + 1,
                         wins = scores.wins + EXCLUDED.wins,
                         last_updated = CURRENT_TIMESTAMP
-            ''', (user_id, chat_id, username, first_name, last_name, score, win_inc))
+            '''
+
+    @timed
+    def save_score(self, user_id, chat_id, username, first_name, last_name, score, is_winner=False):
+        conn = self._get_conn()
+        cur = conn.cursor()
+        win_inc = 1 if is_winner else 0
+
+        cur.execute(self._upsert_score_sql(), (user_id, chat_id, username, first_name, last_name, score, win_inc))
+
+        conn.commit()
+        conn.close()
+
+    @timed
+    def save_scores(self, rows):
+        """
+        Bulk version of save_score in a single transaction.
+        rows: iterable of dicts with the same keys as save_score's arguments
+        """
+        params = [
+            (
+                r["user_id"], r["chat_id"], r.get("username", ""), r.get("first_name", ""),
+                r.get("last_name", ""), r["score"], 1 if r.get("is_winner") else 0
+            )
+            for r in rows
+        ]
+        if not params:
+            return
+
+        conn = self._get_conn()
+        cur = conn.cursor()
+
+        if self.mode == "sqlite":
+            cur.executemany(self._upsert_score_sql(), params)
+        else:
+            execute_batch(cur, self._upsert_score_sql(), params)
 
         conn.commit()
         conn.close()
 
+    @timed
     def get_leaderboard(self, chat_id, limit=10):
         conn = self._get_conn()
         cur = conn.cursor()
@@ -1,18 +1,31 @@
 #!/usr/bin/env python
 
 import json
-import random
 import sqlite3
 import os
+import html
+import time
 from dotenv import load_dotenv
+
+load_dotenv()  # before importing app modules, which read their settings from the env at import
+
 from apscheduler.jobstores.base import JobLookupError
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, User
+from telegram import (
+    Update,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
+    User
+)
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
     MessageHandler,
     CallbackContext,
     CallbackQueryHandler,
+    InlineQueryHandler,
+    TypeHandler,
     filters
 )
 
@@ -22,7 +35,11 @@ import logging
 from logging.handlers import TimedRotatingFileHandler
 
 import question_handler as question_handler
+import tournament as tournament_handler
+import session_reaper
+import speed_round
 from database_handler import DatabaseManager
+from profiler import profiler, timed, is_admin, PROFILING_ENABLED, MAX_WINDOW_SECONDS
 
 db = DatabaseManager()
 
@@ -48,6 +65,7 @@ file_handler = TimedRotatingFileHandler(
     utc=True                   # Optional: use UTC time; remove if you prefer local
 )
 file_handler.setFormatter(formatter)
+file_handler.emit = timed(file_handler.emit)  # synchronous disk write on the event loop
 
 # Add handlers
 logger.addHandler(console_handler)
@@ -55,23 +73,12 @@ logger.addHandler(file_handler)
 
 os.environ["SSL_CERT_FILE"] = "./cacert-2025-02-25.pem"  # SSL fix
 
-load_dotenv()
 TOKEN = os.getenv("TOKEN")
 
 if not TOKEN:
     raise ValueError("Telegram token not set! Add it to your .env file")
 
 VALID_CATEGORIES = ['All', 'Trivia', 'Verses']
-TYPE_LABELS = {
-    "verse_complete": "Complete the verse",
-    "verse_identify": "Identify the verse",
-    "verse_fact": "Trivia",
-    "book_fact": "Trivia",
-    "character_fact": "Trivia",
-    "location_fact": "Trivia",
-    "number_fact": "Trivia",
-    "general_trivia": "Trivia"
-}
 
 
 ### DEBUGGING ###############################################################
@@ -97,22 +104,41 @@ def log_quiz_state(context):
 # START QUIZ #
 ##############
 
+@timed
 async def start(update: Update, context: CallbackContext):
+    await begin_setup(update, context, "classic")
+
+
+@timed
+async def speed(update: Update, context: CallbackContext):
+    """Speed round: everyone answers within the window, ranked by response time"""
+    await begin_setup(update, context, "speed")
+
+
+async def begin_setup(update: Update, context: CallbackContext, mode: str):
+    if context.chat_data.get("tournament_id"):
+        await update.message.reply_text("⚠️ This chat is in a tournament. Use /tournament leave first.")
+        return
+
     if context.chat_data.get("quiz") or context.chat_data.get("quiz_setup_pending"): # prevent concurrent quiz setup
         await update.message.reply_text("⚠️ A quiz is already being set up or in progress. Please finish it first.")
         return
 
     context.chat_data["quiz_setup_pending"] = True  # Set flag early to avoid race conditions
+    context.chat_data["quiz_setup_started"] = time.monotonic()  # lets the session reaper expire abandoned setups
+    context.chat_data["quiz_setup_mode"] = mode
 
     keyboard = [
         [InlineKeyboardButton(cat.capitalize(), callback_data=f"select_category:{cat}")]
         for cat in VALID_CATEGORIES
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text("📚 Choose a category:", reply_markup=reply_markup)
+    prompt = "⏱ Speed round! Choose a category:" if mode == "speed" else "📚 Choose a category:"
+    await update.message.reply_text(prompt, reply_markup=reply_markup)
 
 
 # Callback query handler for category selection
+@timed
 async def handle_category_selection(update: Update, context: CallbackContext):
     query = update.callback_query
     await query.answer()
@@ -141,6 +167,7 @@ async def handle_category_selection(update: Update, context: CallbackContext):
     )
 
 
+@timed
 async def handle_round_selection(update: Update, context: CallbackContext):
     query = update.callback_query
     await query.answer()
@@ -165,18 +192,31 @@ async def handle_round_selection(update: Update, context: CallbackContext):
 
 
 # Actual logic to start the quiz (reused for both direct /quiz and button press)
+@timed
 async def start_quiz(update: Update, context: CallbackContext, category: str, rounds: int):
+    # Loads the chat's language bank in a worker thread on first use. The round
+    # selection handler is non-blocking, so other chats keep being served meanwhile
+    language = chat_language(context, update.effective_chat.id)
+    bank = await question_handler.get_bank(language) or question_handler.DEFAULT_BANK
+
+    # Re-check after the await: a double tap may have started the quiz already
+    if context.chat_data.get("quiz"):
+        return
+
     context.chat_data.pop("quiz_setup_pending", None)
+    context.chat_data.pop("quiz_setup_started", None)
+    mode = context.chat_data.pop("quiz_setup_mode", "classic")
 
-    # questions is a list of tuples: (question, answer, type)
-    questions = question_handler.fetch_questions(category, rounds) 
+    # questions is a list of prepared question dicts
+    questions = bank.fetch_questions(category, rounds)
     
-    if len(questions) < rounds:
+    if not questions:
         await update.effective_message.reply_text("⚠️ Not enough questions in this category!", parse_mode="HTML")
         return
 
     context.chat_data['quiz'] = {
         'category': category,
+        'mode': mode,
         'current_question': 0,
         'questions': questions,
         'correct_answer': None,
@@ -216,6 +256,7 @@ def update_score(context: CallbackContext, user: User, points: int):
 # QUESTION HANDLING #
 #####################
 
+@timed
 async def ask_question(context: CallbackContext, quiz_data: dict):
     print("GOT HERE")
     if not quiz_data:
@@ -244,27 +285,30 @@ async def ask_question(context: CallbackContext, quiz_data: dict):
         await end_quiz(context, quiz_data)
         return
 
-    question, answer, question_type = quiz_data["questions"][current]
-    quiz_data["correct_answer"] = answer.strip().lower()
+    q = quiz_data["questions"][current]
+    quiz_data["correct_answer"] = q["correct_answer"]
     quiz_data["answered"] = False
     quiz_data["hint_level"] = 0
     quiz_data["start_time"] = datetime.now()
 
-    # Build masked answer
-    masked = ["_" if ch.isalnum() else ch for ch in answer]
-    quiz_data["masked"] = masked
+    # Speed round: open a fresh buffer (and monotonic clock) before sending so
+    # answers arriving while the send is in flight are kept
+    if quiz_data.get("mode") == "speed":
+        speed_round.open_buffer(quiz_data)
 
-    # Send question using HTML
+    # Send question using HTML (body is pre-rendered and escaped at load time)
     await context.bot.send_message(
         chat_id=quiz_data["chat_id"],
-        text=(
-            f"🧠 <b>Question {current+1}/{total} "
-            f"[{TYPE_LABELS.get(question_type)}]</b>\n\n"
-            f"{question}\n\n"
-            f"<code>{' '.join(masked)}</code>"
-        ),
+        text=question_handler.question_text(q, current, total),
         parse_mode="HTML"
     )
+
+    # Speed round: buffer every answer until the window closes, no hints
+    if quiz_data.get("mode") == "speed":
+        quiz_data["timeout_job"] = context.job_queue.run_once(
+            close_speed_window, speed_round.SPEED_WINDOW, data={'chat_id': quiz_data["chat_id"]}
+        )
+        return
     
     # Schedule hint jobs at 8s, 16s, 24s
     job_refs = []
@@ -280,6 +324,7 @@ async def ask_question(context: CallbackContext, quiz_data: dict):
     quiz_data["timeout_job"] = timeout
 
 
+@timed
 async def send_hint(context: CallbackContext):
     level = context.job.data["level"]
     chat_id = context.job.data["chat_id"]
@@ -289,36 +334,22 @@ async def send_hint(context: CallbackContext):
     if not quiz_data or quiz_data.get("answered"):
         return
 
-    answer = quiz_data["correct_answer"]
-    masked = quiz_data["masked"]
-
-    # Cap hint levels for short answers
-    max_hint_level = 3
-    if len(answer) < 3:
-        max_hint_level = 1
-    if level > max_hint_level:
-        return  # do not reveal further hints
-
-    indices = [i for i, c in enumerate(masked) if c == "_"]
-
-    # Reveal 30% of remaining characters (at least 1)
-    to_reveal = max(1, round(0.3 * len(indices)))
-    reveal_indices = random.sample(indices, min(to_reveal, len(indices)))
-
-    for i in reveal_indices:
-        masked[i] = answer[i]
+    q = quiz_data["questions"][quiz_data["current_question"]]
+    hint_text = question_handler.render_hint(q, level)
+    if not hint_text:
+        return  # do not reveal further hints for short answers
 
     quiz_data["hint_level"] = level
-    quiz_data["masked"] = masked
 
     # Send hint using HTML — <code> preserves formatting
     await context.bot.send_message(
         chat_id=chat_id,
-        text=f"💡 Hint {level}/{max_hint_level}:\n<code>{' '.join(masked)}</code>",
+        text=hint_text,
         parse_mode="HTML"
     )
 
 
+@timed
 async def question_timeout(context: CallbackContext):
     print("⌛ Timeout triggered")
     chat_id   = context.job.data["chat_id"]
@@ -331,12 +362,12 @@ async def question_timeout(context: CallbackContext):
 
     # mark this round finished
     quiz_data["answered"] = True
-    answer = quiz_data["correct_answer"]
+    q = quiz_data["questions"][quiz_data["current_question"]]
 
     # Send timeout message using HTML
     await context.bot.send_message(
         chat_id=chat_id,
-        text=f"⌛ <b>Time's up!</b> The correct answer was: <b>{answer}</b>",
+        text=q["html_timeout"],
         parse_mode="HTML"
     )
 
@@ -353,6 +384,30 @@ async def question_timeout(context: CallbackContext):
 
 
 
+@timed
+async def close_speed_window(context: CallbackContext):
+    chat_id   = context.job.data["chat_id"]
+    chat_data = context.application.chat_data.get(chat_id, {})
+    quiz_data = chat_data.get("quiz")
+
+    if not quiz_data or quiz_data.get("answered"):
+        return
+
+    # Close the window, then judge everything buffered in one batch
+    quiz_data["answered"] = True
+    q = quiz_data["questions"][quiz_data["current_question"]]
+    results = speed_round.evaluate_buffer(quiz_data)
+
+    await context.bot.send_message(
+        chat_id=chat_id,
+        text=speed_round.format_results(results, q["html_answer"]),
+        parse_mode="HTML"
+    )
+
+    quiz_data["current_question"] += 1
+    await ask_question(context, quiz_data)
+
+
 def is_answer_correct(user_answer: str, correct_answer: str) -> bool:
     if not user_answer or not correct_answer:
         return False
@@ -360,8 +415,17 @@ def is_answer_correct(user_answer: str, correct_answer: str) -> bool:
     return user_answer.strip().lower() == correct_answer.strip().lower()
 
 
+@timed
 async def handle_text_answer(update: Update, context: CallbackContext):
     chat_data = context.chat_data  # per-chat context
+
+    tournament_id = chat_data.get("tournament_id")
+    if tournament_id and update.message and update.message.text:
+        tournament = tournament_handler.get_tournament(context, tournament_id)
+        if tournament:
+            await tournament_handler.handle_tournament_answer(update, context, tournament)
+            return
+
     quiz_data = chat_data.get("quiz")
 
     if not quiz_data:
@@ -372,6 +436,11 @@ async def handle_text_answer(update: Update, context: CallbackContext):
         print("⚠️ No message text received")
         return
 
+    if quiz_data.get("mode") == "speed":
+        if not quiz_data.get("answered") and "answer_buffer" in quiz_data:
+            speed_round.record_answer(quiz_data, update.effective_user, update.message.text)
+        return
+
     user_answer = update.message.text
     correct_answer = quiz_data.get("correct_answer")
 
@@ -418,9 +487,11 @@ async def handle_text_answer(update: Update, context: CallbackContext):
 ############
 # END QUIZ #
 ############
+@timed
 async def end_quiz(context: CallbackContext, quiz_data: dict):
     # Optional cleanup
     context.application.chat_data.get(quiz_data["chat_id"], {}).pop("quiz_setup_pending", None)
+    context.application.chat_data.get(quiz_data["chat_id"], {}).pop("quiz_setup_mode", None)
     context.application.chat_data.get(quiz_data["chat_id"], {}).pop("quiz", None)
 
     chat_id = quiz_data["chat_id"]
@@ -448,15 +519,11 @@ async def end_quiz(context: CallbackContext, quiz_data: dict):
         prefix = "🏆" if user_id in winners else "🏅"
         lines.append(f"{prefix} {display}: {score} point{'s' if score != 1 else ''}")
 
-        db.save_score(
-            user_id=user_id,
-            chat_id=chat_id,
-            username=data.get("username", ""),
-            first_name=data.get("first_name", ""),
-            last_name=data.get("last_name", ""),
-            score=score,
-            is_winner=user_id in winners  # pass True/False
-        )
+    # Persist every player's result in one transaction
+    db.save_scores([
+        dict(data, user_id=user_id, chat_id=chat_id, is_winner=user_id in winners)
+        for user_id, data in sorted_scores
+    ])
 
     leaderboard_text = "\n".join(lines)
 
@@ -468,6 +535,163 @@ async def end_quiz(context: CallbackContext, quiz_data: dict):
 
 
 
+############
+# LANGUAGE #
+############
+
+def chat_language(context: CallbackContext, chat_id: int):
+    # Kept in bot_data so the session reaper evicting idle chat_data doesn't reset it
+    return context.application.bot_data.get("chat_languages", {}).get(chat_id)
+
+
+@timed
+async def language(update: Update, context: CallbackContext):
+    """/language [code] — show or set this chat's question language"""
+    languages = question_handler.available_languages()
+    current = chat_language(context, update.effective_chat.id) or question_handler.DEFAULT_LANGUAGE
+
+    if not context.args:
+        await update.message.reply_text(
+            f"🌐 Current language: {current}\nAvailable: {', '.join(languages)}\nUse /language <code> to change."
+        )
+        return
+
+    code = context.args[0].lower()
+    if code not in languages:
+        await update.message.reply_text(f"⚠️ Unknown language. Available: {', '.join(languages)}")
+        return
+
+    context.application.bot_data.setdefault("chat_languages", {})[update.effective_chat.id] = code
+
+    # Warm the bank in the background so the next quiz doesn't wait on the load
+    context.application.create_task(question_handler.get_bank(code))
+    await update.message.reply_text(f"🌐 Language set to {code}.")
+
+
+
+##############
+# TOURNAMENT #
+##############
+
+TOURNAMENT_USAGE = (
+    "🏟 Tournament commands:\n"
+    "/tournament new <category> <rounds> — create and join from this chat\n"
+    "/tournament join <id> — join from another chat\n"
+    "/tournament start <id> — start (creator only)\n"
+    "/tournament leave — leave before it starts"
+)
+
+
+@timed
+async def tournament_command(update: Update, context: CallbackContext):
+    args = context.args or []
+    chat_id = update.effective_chat.id
+    action = args[0].lower() if args else ""
+
+    if action == "new" and len(args) == 3:
+        category = args[1].title()
+        if category not in VALID_CATEGORIES or not args[2].isdigit():
+            await update.message.reply_text(TOURNAMENT_USAGE)
+            return
+        if context.chat_data.get("quiz") or context.chat_data.get("quiz_setup_pending") or context.chat_data.get("tournament_id"):
+            await update.message.reply_text("⚠️ A quiz is already being set up or in progress in this chat.")
+            return
+
+        # tournament_command is non-blocking, so a first-use bank load doesn't stall other chats
+        bank = await question_handler.get_bank(chat_language(context, chat_id)) or question_handler.DEFAULT_BANK
+        if context.chat_data.get("quiz") or context.chat_data.get("quiz_setup_pending") or context.chat_data.get("tournament_id"):
+            await update.message.reply_text("⚠️ A quiz is already being set up or in progress in this chat.")
+            return
+
+        tournament = tournament_handler.create_tournament(context, update.effective_user.id, category, int(args[2]), bank)
+        if not tournament:
+            await update.message.reply_text("⚠️ Not enough questions in this category!")
+            return
+
+        tournament_handler.join_tournament(context, tournament, chat_id)
+        await update.message.reply_text(
+            f"🏟 Tournament <b>{tournament.id}</b> created: <b>{category}</b>, {tournament.rounds} rounds.\n"
+            f"Other chats can join with <code>/tournament join {tournament.id}</code>",
+            parse_mode="HTML"
+        )
+
+    elif action == "join" and len(args) == 2:
+        tournament = tournament_handler.get_tournament(context, args[1])
+        if not tournament:
+            await update.message.reply_text("⚠️ No such tournament.")
+            return
+        if context.chat_data.get("quiz") or context.chat_data.get("quiz_setup_pending") or context.chat_data.get("tournament_id"):
+            await update.message.reply_text("⚠️ A quiz is already being set up or in progress in this chat.")
+            return
+        if not tournament_handler.join_tournament(context, tournament, chat_id):
+            await update.message.reply_text("⚠️ This tournament has already started.")
+            return
+        await update.message.reply_text(f"✅ Joined tournament {tournament.id} ({len(tournament.chat_ids)} chats).")
+
+    elif action == "start" and len(args) == 2:
+        tournament = tournament_handler.get_tournament(context, args[1])
+        if not tournament or tournament.owner_id != update.effective_user.id or tournament.started:
+            await update.message.reply_text("⚠️ Only the creator can start a tournament that hasn't started yet.")
+            return
+        tournament_handler.start_tournament(context, tournament)
+
+    elif action == "leave":
+        tournament = tournament_handler.get_tournament(context, context.chat_data.get("tournament_id"))
+        if not tournament or tournament.started:
+            await update.message.reply_text("⚠️ Not in a tournament that can be left.")
+            return
+        tournament_handler.leave_tournament(context, tournament, chat_id)
+        await update.message.reply_text(f"👋 Left tournament {tournament.id}.")
+
+    else:
+        await update.message.reply_text(TOURNAMENT_USAGE)
+
+
+
+#################
+# INLINE SEARCH #
+#################
+
+@timed
+async def inline_search(update: Update, context: CallbackContext):
+    """
+    @bot <words>          — search the default bank by question/answer words (and book for verses)
+    @bot lang:<code> ...  — search that language's bank instead
+    """
+    inline_query = update.inline_query
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+
+    query = inline_query.query.strip()
+    language = None
+    if query.lower().startswith("lang:"):
+        prefix, _, query = query.partition(" ")
+        language = prefix[len("lang:"):].lower()
+
+    # Registered non-blocking, so a first-use bank load doesn't stall other updates
+    bank = await question_handler.get_bank(language) or question_handler.DEFAULT_BANK
+    matches, next_offset = bank.search_questions(query, offset)
+
+    results = [
+        InlineQueryResultArticle(
+            id=q.get("uuid") or f"{offset}-{i}",
+            title=q["question"][:100],
+            description=q["label"],  # answer stays hidden behind the spoiler
+            input_message_content=InputTextMessageContent(
+                f"<b>{html.escape(q['question'])}</b>\n✅ <tg-spoiler>{html.escape(q['answer'])}</tg-spoiler>",
+                parse_mode="HTML"
+            ),
+        )
+        for i, q in enumerate(matches)
+    ]
+
+    await inline_query.answer(
+        results,
+        next_offset=str(next_offset) if next_offset is not None else "",
+        cache_time=60
+    )
+
+
+
 ###############
 # LEADERBOARD #
 ###############
@@ -478,6 +702,7 @@ from telegram.ext import CallbackContext
 import sqlite3
 
 
+@timed
 async def leaderboard(update: Update, context: CallbackContext):
     chat_id = update.effective_chat.id
 
@@ -523,7 +748,80 @@ async def leaderboard(update: Update, context: CallbackContext):
 
 
 
+#############
+# PROFILING #
+#############
+
+async def profile(update: Update, context: CallbackContext):
+    """
+    /profile [seconds]  -> profile the event loop for a bounded window
+    /profile stop       -> stop early and write the report
+    """
+    if not PROFILING_ENABLED or not is_admin(update.effective_user.id):
+        return
+
+    args = context.args or []
+    if args and args[0].lower() == "stop":
+        await finish_profile(context, update.effective_chat.id)
+        return
+
+    try:
+        seconds = max(1, min(int(args[0]), MAX_WINDOW_SECONDS)) if args else 60
+    except ValueError:
+        await update.message.reply_text("Usage: /profile [seconds] or /profile stop")
+        return
+
+    if not profiler.start():
+        await update.message.reply_text("⚠️ Profiling is already running.")
+        return
+
+    context.job_queue.run_once(stop_profile, seconds, name="profile_stop", chat_id=update.effective_chat.id)
+    await update.message.reply_text(f"⏱ Profiling for {seconds}s...")
+
+
+async def stop_profile(context: CallbackContext):
+    await finish_profile(context, context.job.chat_id)
+
+
+async def finish_profile(context: CallbackContext, chat_id: int):
+    for job in context.job_queue.get_jobs_by_name("profile_stop"):
+        job.schedule_removal()
+
+    paths = profiler.stop()
+    if not paths:
+        await context.bot.send_message(chat_id=chat_id, text="⚠️ Profiling is not running.")
+        return
+
+    logger.info(f"Profiling stopped, report: {paths[0]}, flamegraph: {paths[1]}")
+    await context.bot.send_message(
+        chat_id=chat_id,
+        text=f"✅ Profiling stopped.\nReport: {paths[0]}\nFlamegraph: {paths[1]}"
+    )
+
+
+@timed
+async def sessions(update: Update, context: CallbackContext):
+    """Admin-only: live vs. evicted session counts from the session reaper"""
+    if not is_admin(update.effective_user.id):
+        return
+
+    m = session_reaper.METRICS
+    await update.message.reply_text(
+        f"🧹 Sessions\n"
+        f"Live chats: {len(context.application.chat_data)}\n"
+        f"Live users: {len(context.application.user_data)}\n"
+        f"Expired setups: {m['expired_setups']}\n"
+        f"Evicted chats: {m['evicted_chats']}\n"
+        f"Evicted users: {m['evicted_users']}"
+    )
+
+
 async def log_all_messages(update: Update, context: CallbackContext):
+    # Keep synchronous file logging off the speed-round hot path
+    quiz_data = context.chat_data.get("quiz") if context.chat_data is not None else None
+    if quiz_data and quiz_data.get("mode") == "speed":
+        return
+
     user = update.effective_user
     chat = update.effective_chat
     message = update.message
@@ -534,18 +832,26 @@ async def log_all_messages(update: Update, context: CallbackContext):
     logger.info(f"User: {user.username} (ID: {user.id})")
     logger.info(f"Text: {message.text}")
 
-    # Forward to actual handler
-    await handle_text_answer(update, context)
-
 
 
 def main():
     application = ApplicationBuilder().token(TOKEN).build()
+    application.bot_data["db"] = db
+
+    # Stamp activity before any other handler runs, and expire idle state periodically
+    application.add_handler(TypeHandler(Update, session_reaper.touch_session), group=-1)
+    session_reaper.schedule_reaper(application)
 
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("speed", speed))
     application.add_handler(CommandHandler("leaderboard", leaderboard))
+    application.add_handler(CommandHandler("profile", profile))
+    application.add_handler(CommandHandler("tournament", tournament_command, block=False))
+    application.add_handler(CommandHandler("language", language))
+    application.add_handler(CommandHandler("sessions", sessions))
     application.add_handler(CallbackQueryHandler(handle_category_selection, pattern="^select_category:"))
-    application.add_handler(CallbackQueryHandler(handle_round_selection, pattern="^select_rounds:"))
+    application.add_handler(CallbackQueryHandler(handle_round_selection, pattern="^select_rounds:", block=False))
+    application.add_handler(InlineQueryHandler(inline_search, block=False))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_answer))
 
     # Debug: Print all registered handlers
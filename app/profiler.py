@@ -0,0 +1,183 @@
+import os
+import sys
+import time
+import asyncio
+import functools
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import logging
+
+logger = logging.getLogger("quizbot")
+
+# Env toggles
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0").lower() in ("1", "true", "yes")
+ADMIN_USER_IDS = {int(u) for u in os.getenv("ADMIN_USER_IDS", "").split(",") if u.strip()}
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_MS", "10")) / 1000
+BLOCKING_THRESHOLD = float(os.getenv("PROFILE_BLOCKING_MS", "100")) / 1000
+MAX_WINDOW_SECONDS = 600
+
+
+class Profiler:
+    """
+    Samples the event loop thread's stack and collects per-function wall time
+    for a bounded window. Only `active` is checked when profiling is off.
+    """
+
+    def __init__(self):
+        self.active = False
+        self._reset()
+
+    def _reset(self):
+        self.started_at = None
+        self.timings = defaultdict(list)    # qualified name -> [seconds, ...]
+        self.stacks = Counter()             # folded stack -> sample count
+        self.blocking = []                  # (name, seconds)
+        self.stalls = []                    # (seconds, folded stack)
+        self._loop_thread_id = None
+        self._heartbeat = 0.0
+        self._stop_event = threading.Event()
+        self._sampler = None
+        self._heartbeat_task = None
+
+    def start(self):
+        if self.active:
+            return False
+        self._reset()
+        self.started_at = datetime.now()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.perf_counter()
+        self._heartbeat_task = asyncio.get_running_loop().create_task(self._beat())
+        self._sampler = threading.Thread(target=self._sample, name="quizbot-profiler", daemon=True)
+        self._sampler.start()
+        self.active = True
+        return True
+
+    def stop(self):
+        """Stops profiling and returns the paths of the written report files."""
+        if not self.active:
+            return None
+        self.active = False
+        self._stop_event.set()
+        self._sampler.join(timeout=1)
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+        return self._write_report()
+
+    def record(self, name, elapsed, blocking=False):
+        self.timings[name].append(elapsed)
+        if blocking and elapsed >= BLOCKING_THRESHOLD:
+            self.blocking.append((name, elapsed))
+
+    async def _beat(self):
+        # Heartbeat from inside the loop; a stale value means the loop is blocked
+        while True:
+            self._heartbeat = time.perf_counter()
+            await asyncio.sleep(SAMPLE_INTERVAL)
+
+    def _sample(self):
+        stalled = False
+        while not self._stop_event.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            folded = _fold(frame)
+            self.stacks[folded] += 1
+
+            lag = time.perf_counter() - self._heartbeat
+            if lag >= BLOCKING_THRESHOLD and not stalled:
+                self.stalls.append((lag, folded))
+                stalled = True
+            elif lag < BLOCKING_THRESHOLD:
+                stalled = False
+
+    def _write_report(self):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stamp = self.started_at.strftime("%Y%m%d-%H%M%S")
+        folded_path = os.path.join(PROFILE_DIR, f"profile-{stamp}.folded")
+        report_path = os.path.join(PROFILE_DIR, f"profile-{stamp}.txt")
+
+        # Brendan Gregg collapsed-stack format, consumable by flamegraph.pl / speedscope
+        with open(folded_path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        duration = (datetime.now() - self.started_at).total_seconds()
+        lines = [
+            f"Profile window: {self.started_at.isoformat()} ({duration:.1f}s)",
+            f"Stack samples: {sum(self.stacks.values())} every {SAMPLE_INTERVAL * 1000:.0f}ms",
+            "",
+            "Wall time per function (calls, total, mean, max):",
+        ]
+        by_total = sorted(self.timings.items(), key=lambda kv: sum(kv[1]), reverse=True)
+        for name, samples in by_total:
+            total = sum(samples)
+            lines.append(
+                f"  {name}: {len(samples)} calls, {total * 1000:.1f}ms total, "
+                f"{total / len(samples) * 1000:.1f}ms mean, {max(samples) * 1000:.1f}ms max"
+            )
+
+        lines += ["", f"Blocking calls on the event loop (>= {BLOCKING_THRESHOLD * 1000:.0f}ms):"]
+        for name, elapsed in sorted(self.blocking, key=lambda b: b[1], reverse=True):
+            lines.append(f"  {name}: {elapsed * 1000:.1f}ms")
+
+        lines += ["", "Event loop stalls (heartbeat lag, stack at detection):"]
+        for lag, stack in sorted(self.stalls, key=lambda s: s[0], reverse=True):
+            innermost = stack.rsplit(";", 3)[-3:]
+            lines.append(f"  {lag * 1000:.1f}ms at {';'.join(innermost)}")
+
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+        logger.info(f"Profile written to {report_path} and {folded_path}")
+        return report_path, folded_path
+
+
+def _fold(frame):
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+profiler = Profiler()
+
+
+def timed(func):
+    """
+    Records wall time per call while profiling is active. Synchronous
+    functions are assumed to run on the event loop and are flagged as
+    blocking when they exceed the threshold.
+    """
+    name = func.__qualname__
+
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if not profiler.active:
+                return await func(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                profiler.record(name, time.perf_counter() - t0)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not profiler.active:
+            return func(*args, **kwargs)
+        t0 = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.record(name, time.perf_counter() - t0, blocking=True)
+    return wrapper
+
+
+def is_admin(user_id):
+    return user_id in ADMIN_USER_IDS
@@ -1,38 +1,292 @@
+import os
+import re
+import sys
+import html
 import json
 import random
+import asyncio
+import logging
+from bisect import bisect_left
+from functools import lru_cache
+from collections import OrderedDict, defaultdict
 from pathlib import Path
 
-# Load the JSON file at bot startup
-QUESTIONS_FILE = Path("data/questions.json")
+logger = logging.getLogger("quizbot")
 
-with QUESTIONS_FILE.open("r", encoding="utf-8") as f:
-    ALL_QUESTIONS = json.load(f)
+# Default bank is loaded at bot startup; other languages load on first use
+DATA_DIR = Path("data")
+QUESTIONS_FILE = DATA_DIR / "questions.json"
+DEFAULT_LANGUAGE = "en"
+BANK_MEMORY_BUDGET = int(float(os.getenv("BANK_MEMORY_BUDGET_MB", "64")) * 1024 * 1024)
+LANGUAGE_RE = re.compile(r"^[a-z]{2,3}(-[a-z0-9]{2,8})?$")
 
-# Helper to filter questions by user-selected category
-def filter_questions(user_category: str):
+TYPE_LABELS = {
+    "verse_complete": "Complete the verse",
+    "verse_identify": "Identify the verse",
+    "verse_fact": "Trivia",
+    "book_fact": "Trivia",
+    "character_fact": "Trivia",
+    "location_fact": "Trivia",
+    "number_fact": "Trivia",
+    "general_trivia": "Trivia"
+}
+MAX_HINT_LEVEL = 3
+
+
+# Pre-render the static parts of each question's messages once at load time
+def prepare_question(q: dict):
+    answer = q["answer"]
+    masked = ["_" if ch.isalnum() else ch for ch in answer]
+
+    q["correct_answer"] = answer.strip().lower()
+    q["label"] = TYPE_LABELS.get(q["type"])
+    q["masked"] = masked
+    q["html_label"] = html.escape(str(q["label"]))
+    q["html_body"] = (
+        f"{html.escape(q['question'])}\n\n"
+        f"<code>{html.escape(' '.join(masked))}</code>"
+    )
+    q["html_answer"] = html.escape(q["correct_answer"])
+    q["html_timeout"] = f"⌛ <b>Time's up!</b> The correct answer was: <b>{q['html_answer']}</b>"
+    q["hints"] = None  # rendered on first use, see render_hint
+    return q
+
+
+def render_hint(q: dict, level: int):
     """
-    user_category: "All", "Trivia", "Verses"
+    Returns the HTML hint message for `level` (1-based), or None if the answer
+    is too short for that many hints. The reveal sequence is computed once per
+    question and cached on it.
     """
-    if user_category.lower() == "all":
-        return ALL_QUESTIONS
-    elif user_category.lower() == "trivia":
-        # All types except verse_complete and verse_identify
-        return [q for q in ALL_QUESTIONS if q["type"] not in ("verse_complete", "verse_identify")]
-    elif user_category.lower() == "verses":
-        return [q for q in ALL_QUESTIONS if q["type"] in ("verse_complete", "verse_identify")]
-    else:
-        return []  # fallback, empty list
+    if q["hints"] is None:
+        answer = q["correct_answer"]
+        masked = list(q["masked"])
 
-def fetch_questions(category="All", rounds=3):
+        # Cap hint levels for short answers
+        max_hint_level = 1 if len(answer) < 3 else MAX_HINT_LEVEL
+
+        hints = []
+        for i in range(1, max_hint_level + 1):
+            indices = [j for j, c in enumerate(masked) if c == "_"]
+
+            # Reveal 30% of remaining characters (at least 1)
+            to_reveal = max(1, round(0.3 * len(indices)))
+            for j in random.sample(indices, min(to_reveal, len(indices))):
+                masked[j] = answer[j]
+
+            hints.append(f"💡 Hint {i}/{max_hint_level}:\n<code>{html.escape(' '.join(masked))}</code>")
+        q["hints"] = hints
+
+    if level > len(q["hints"]):
+        return None
+    return q["hints"][level - 1]
+
+
+def question_text(q: dict, current: int, total: int, prefix: str = "🧠", title: str = "Question"):
+    return f"{prefix} <b>{title} {current+1}/{total} [{q['html_label']}]</b>\n\n{q['html_body']}"
+
+
+# Inverted index for inline search: token -> sorted question positions in the bank
+TOKEN_RE = re.compile(r"\w+")
+SEARCH_PAGE_SIZE = 20
+VERSE_TYPES = ("verse_complete", "verse_identify")
+
+
+def tokenize(text: str):
+    return TOKEN_RE.findall(text.lower())
+
+
+def build_search_index(questions: list):
+    postings = defaultdict(set)
+    for idx, q in enumerate(questions):
+        fields = [q["question"], q["answer"]]
+        if q["type"] in VERSE_TYPES:
+            fields.append(q.get("book", ""))
+        for token in tokenize(" ".join(fields)):
+            postings[token].add(idx)
+
+    return {
+        "postings": {token: sorted(ids) for token, ids in postings.items()},
+        "vocab": sorted(postings),  # sorted so prefixes map to a contiguous range
+    }
+
+
+def estimate_size(obj):
+    """Approximate deep size in bytes of nested dicts/lists/sets/strings, counting shared objects once."""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+    return total
+
+
+class QuestionBank:
+    """
+    One language's questions with its category index and search index,
+    all built once when the bank is loaded.
+    """
+
+    def __init__(self, language: str, path: Path):
+        self.language = language
+        self.path = path
+
+        with path.open("r", encoding="utf-8") as f:
+            self.questions = [prepare_question(q) for q in json.load(f)]
+
+        self.by_category = {
+            "all": self.questions,
+            "trivia": [q for q in self.questions if q["type"] not in VERSE_TYPES],
+            "verses": [q for q in self.questions if q["type"] in VERSE_TYPES],
+        }
+        self.search_index = build_search_index(self.questions)
+        # Cached: short prefixes expand to many vocab entries and repeat as the user types
+        self._prefix_matches = lru_cache(maxsize=1024)(self._prefix_matches_uncached)
+
+        # Resident size of the prepared questions and index, used against the memory budget
+        self.size = estimate_size([self.questions, self.by_category, self.search_index])
+
+    def _prefix_matches_uncached(self, prefix: str):
+        vocab = self.search_index["vocab"]
+        postings = self.search_index["postings"]
+        ids = set()
+        i = bisect_left(vocab, prefix)
+        while i < len(vocab) and vocab[i].startswith(prefix):
+            ids.update(postings[vocab[i]])
+            i += 1
+        return frozenset(ids)
+
+    # Helper to filter questions by user-selected category
+    def filter_questions(self, user_category: str):
+        """
+        user_category: "All", "Trivia", "Verses"
+        """
+        return self.by_category.get(user_category.lower(), [])  # fallback, empty list
+
+    def fetch_questions(self, category="All", rounds=3):
+        """
+        Returns a list of prepared question dicts (see prepare_question)
+        """
+        candidates = self.filter_questions(category)
+
+        if len(candidates) < rounds:
+            return None  # let the bot handle not enough questions
+
+        return random.sample(candidates, rounds)
+
+    def search_questions(self, query: str, offset: int = 0, limit: int = SEARCH_PAGE_SIZE):
+        """
+        Every word in `query` must prefix-match a word in the question, answer or
+        (for verse types) book. Returns (questions, next_offset); next_offset is
+        None on the last page.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return [], None
+
+        # Intersect the rarest terms first
+        matches = sorted((self._prefix_matches(t) for t in set(terms)), key=len)
+        ids = matches[0]
+        for other in matches[1:]:
+            if not ids:
+                break
+            ids = ids & other
+
+        ordered = sorted(ids)
+        page = [self.questions[i] for i in ordered[offset:offset + limit]]
+        next_offset = offset + limit if offset + limit < len(ordered) else None
+        return page, next_offset
+
+
+DEFAULT_BANK = QuestionBank(DEFAULT_LANGUAGE, QUESTIONS_FILE)
+ALL_QUESTIONS = DEFAULT_BANK.questions
+
+# Non-default banks, least recently used first
+_resident_banks = OrderedDict()
+_loading = {}
+
+
+def bank_path(language: str):
+    return DATA_DIR / f"questions.{language}.json"
+
+
+def available_languages():
+    langs = {DEFAULT_LANGUAGE}
+    for path in DATA_DIR.glob("questions.*.json"):
+        langs.add(path.name[len("questions."):-len(".json")])
+    return sorted(langs)
+
+
+def _evict_banks():
+    # The default bank is pinned and not counted against the budget
+    total = sum(bank.size for bank in _resident_banks.values())
+    while total > BANK_MEMORY_BUDGET and len(_resident_banks) > 1:
+        language, bank = _resident_banks.popitem(last=False)
+        total -= bank.size
+        logger.info(f"Evicted question bank '{language}' ({bank.size} bytes)")
+
+
+async def get_bank(language: str = None):
     """
-    Returns a list of tuples: (question, answer, type)
+    Returns the QuestionBank for `language`, loading it in a worker thread on
+    first use so quizzes in other chats keep running. Concurrent first uses
+    share one load. Returns None if no bank exists for the language or it
+    fails to load.
     """
-    candidates = filter_questions(category)
+    if not language or language == DEFAULT_LANGUAGE:
+        return DEFAULT_BANK
+
+    bank = _resident_banks.get(language)
+    if bank:
+        _resident_banks.move_to_end(language)
+        return bank
+
+    if not LANGUAGE_RE.match(language) or not bank_path(language).exists():
+        return None
+
+    task = _loading.get(language)
+    if task is None:
+        task = asyncio.ensure_future(_load_bank(language))
+        _loading[language] = task
+        try:
+            bank = await task
+        finally:
+            _loading.pop(language, None)
+        if bank:
+            _resident_banks[language] = bank
+            logger.info(f"Loaded question bank '{language}' ({len(bank.questions)} questions, ~{bank.size} bytes)")
+            _evict_banks()
+        return bank
+
+    return await task
 
-    if len(candidates) < rounds:
-        return None  # let the bot handle not enough questions
 
-    random.shuffle(candidates)
-    selected = candidates[:rounds]
+async def _load_bank(language: str):
+    # A malformed bank must not break quiz setup: log it and let callers fall back
+    try:
+        return await asyncio.to_thread(QuestionBank, language, bank_path(language))
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        logger.exception(f"Failed to load question bank '{language}'")
+        return None
+
+
+# Default-bank shortcuts
+def filter_questions(user_category: str):
+    return DEFAULT_BANK.filter_questions(user_category)
+
+
+def fetch_questions(category="All", rounds=3):
+    return DEFAULT_BANK.fetch_questions(category, rounds)
+
 
-    return [(q["question"], q["answer"], q["type"]) for q in selected]
+def search_questions(query: str, offset: int = 0, limit: int = SEARCH_PAGE_SIZE):
+    return DEFAULT_BANK.search_questions(query, offset, limit)
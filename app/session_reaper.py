@@ -0,0 +1,93 @@
+import os
+import time
+import logging
+
+from telegram import Update
+from telegram.ext import CallbackContext
+
+logger = logging.getLogger("quizbot")
+
+# Configurable limits (seconds / counts)
+REAPER_INTERVAL = int(os.getenv("SESSION_REAPER_INTERVAL", "60"))
+SETUP_TTL = int(os.getenv("SESSION_SETUP_TTL", "300"))          # abandoned category/round selection
+CHAT_IDLE_TTL = int(os.getenv("SESSION_CHAT_IDLE_TTL", "86400"))
+USER_IDLE_TTL = int(os.getenv("SESSION_USER_IDLE_TTL", "86400"))
+MAX_CHATS = int(os.getenv("SESSION_MAX_CHATS", "5000"))
+MAX_USERS = int(os.getenv("SESSION_MAX_USERS", "20000"))
+
+METRICS = {
+    "expired_setups": 0,
+    "evicted_chats": 0,
+    "evicted_users": 0,
+}
+
+
+async def touch_session(update: Update, context: CallbackContext):
+    """Stamps last activity on every update; registered ahead of the other handlers."""
+    now = time.monotonic()
+    if context.chat_data is not None:
+        context.chat_data["last_active"] = now
+    if context.user_data is not None:
+        context.user_data["last_active"] = now
+
+
+def _chat_busy(chat_data):
+    # Never evict chats with a running quiz, tournament or setup in progress
+    return bool(chat_data.get("quiz") or chat_data.get("tournament_id") or chat_data.get("quiz_setup_pending"))
+
+
+def _user_busy(user_data):
+    # Stale selections are cleared before eviction, so any left are within SETUP_TTL
+    return "selected_category" in user_data
+
+
+def _evict(store, drop, ttl, max_entries, now, busy=lambda data: False):
+    idle = [
+        (data.get("last_active", 0), key)
+        for key, data in store.items()
+        if not busy(data)
+    ]
+    expired = {key for last_active, key in idle if now - last_active > ttl}
+
+    # Over the cap: evict the least recently active idle entries as well
+    overflow = len(store) - len(expired) - max_entries
+    if overflow > 0:
+        remaining = sorted((entry for entry in idle if entry[1] not in expired))
+        expired.update(key for _, key in remaining[:overflow])
+
+    for key in expired:
+        drop(key)
+    return len(expired)
+
+
+async def reap_sessions(context: CallbackContext):
+    app = context.application
+    now = time.monotonic()
+
+    # Abandoned setups: clear the lock so /start works again
+    for chat_data in app.chat_data.values():
+        started = chat_data.get("quiz_setup_started")
+        if chat_data.get("quiz_setup_pending") and started and now - started > SETUP_TTL:
+            chat_data.pop("quiz_setup_pending", None)
+            chat_data.pop("quiz_setup_started", None)
+            chat_data.pop("quiz_setup_mode", None)
+            METRICS["expired_setups"] += 1
+
+    for user_data in app.user_data.values():
+        if "selected_category" in user_data and now - user_data.get("last_active", 0) > SETUP_TTL:
+            user_data.pop("selected_category", None)
+
+    evicted_chats = _evict(app.chat_data, app.drop_chat_data, CHAT_IDLE_TTL, MAX_CHATS, now, _chat_busy)
+    evicted_users = _evict(app.user_data, app.drop_user_data, USER_IDLE_TTL, MAX_USERS, now, _user_busy)
+    METRICS["evicted_chats"] += evicted_chats
+    METRICS["evicted_users"] += evicted_users
+
+    if evicted_chats or evicted_users:
+        logger.info(
+            f"Session reaper: evicted {evicted_chats} chats, {evicted_users} users; "
+            f"{len(app.chat_data)} chats, {len(app.user_data)} users live; {METRICS}"
+        )
+
+
+def schedule_reaper(application):
+    application.job_queue.run_repeating(reap_sessions, REAPER_INTERVAL, first=REAPER_INTERVAL, name="session_reaper")
@@ -0,0 +1,66 @@
+import os
+import html
+import time
+
+# Speed round: everyone may answer within the window, ranked by response time
+SPEED_WINDOW = int(os.getenv("SPEED_ROUND_WINDOW", "20"))
+SPEED_POINTS = [5, 3, 2]   # by rank; every other correct answer gets 1
+MEDALS = ["🥇", "🥈", "🥉"]
+
+
+def open_buffer(quiz_data: dict):
+    quiz_data["start_mono"] = time.monotonic()
+    quiz_data["answer_buffer"] = []
+
+
+def record_answer(quiz_data: dict, user, text: str):
+    """Hot path: only timestamps and appends, judging happens in evaluate_buffer."""
+    quiz_data["answer_buffer"].append((time.monotonic(), user.id, user.username, user.first_name, user.last_name, text))
+
+
+def evaluate_buffer(quiz_data: dict):
+    """
+    Judges every buffered answer in one pass when the window closes.
+    Returns [(user_id, display_name, elapsed_seconds, points), ...] fastest first;
+    each user's earliest correct answer counts.
+    """
+    buffer = quiz_data.get("answer_buffer") or []
+    quiz_data["answer_buffer"] = []
+    correct = quiz_data["correct_answer"]
+    start = quiz_data["start_mono"]
+
+    fastest = {}
+    for ts, user_id, username, first_name, last_name, text in buffer:
+        if user_id in fastest or text.strip().lower() != correct:
+            continue
+        fastest[user_id] = (ts - start, username or "", first_name or "", last_name or "")
+
+    ranked = sorted(fastest.items(), key=lambda kv: kv[1][0])
+
+    scores = quiz_data.setdefault("scores", {})
+    results = []
+    for rank, (user_id, (elapsed, username, first_name, last_name)) in enumerate(ranked):
+        points = SPEED_POINTS[rank] if rank < len(SPEED_POINTS) else 1
+
+        if user_id not in scores:
+            scores[user_id] = {
+                "username": username,
+                "first_name": first_name,
+                "last_name": last_name,
+                "score": 0
+            }
+        scores[user_id]["score"] += points
+
+        results.append((user_id, username or first_name, elapsed, points))
+    return results
+
+
+def format_results(results: list, answer_html: str):
+    if not results:
+        return f"⌛ <b>Time's up!</b> Nobody got it. The correct answer was: <b>{answer_html}</b>"
+
+    lines = [f"⏱ <b>Speed round results</b> — answer: <b>{answer_html}</b>", ""]
+    for rank, (_, name, elapsed, points) in enumerate(results):
+        medal = MEDALS[rank] if rank < len(MEDALS) else "🏅"
+        lines.append(f"{medal} {html.escape(name)}: {elapsed:.2f}s (+{points})")
+    return "\n".join(lines)
@@ -0,0 +1,330 @@
+import os
+import asyncio
+import secrets
+import logging
+
+from apscheduler.jobstores.base import JobLookupError
+from telegram.error import Forbidden, RetryAfter, TelegramError
+
+import question_handler as question_handler
+from profiler import timed
+
+logger = logging.getLogger("quizbot")
+
+SEND_CONCURRENCY = int(os.getenv("TOURNAMENT_SEND_CONCURRENCY", "20"))
+SEND_ATTEMPTS = 5
+LOBBY_TTL = int(os.getenv("TOURNAMENT_LOBBY_TTL", "1800"))  # unstarted tournaments expire after this
+HINT_DELAYS = [8, 16, 24]
+QUESTION_TIMEOUT = 30
+SCORE_MAP = {0: 5, 1: 3, 2: 2, 3: 1}  # based on which 8-sec interval it's answered
+
+
+class Tournament:
+    """
+    One question set played simultaneously in many chats with a combined scoreboard.
+    Questions are drawn once and a single job chain drives hints/timeouts for every chat.
+    """
+
+    def __init__(self, tournament_id, owner_id, category, rounds, questions):
+        self.id = tournament_id
+        self.owner_id = owner_id
+        self.category = category
+        self.rounds = rounds
+        self.questions = questions      # list of prepared question dicts
+        self.chat_ids = set()
+        self.started = False
+
+        self.current_question = 0
+        self.correct_answer = None
+        self.hint_level = 0
+        self.accepting = False
+        self.answered_chats = set()
+        self.job = None
+
+        # (user_id, chat_id) -> {"username", "first_name", "last_name", "score"}
+        self.scores = {}
+
+
+def _tournaments(context):
+    return context.application.bot_data.setdefault("tournaments", {})
+
+
+def get_tournament(context, tournament_id):
+    return _tournaments(context).get(tournament_id)
+
+
+def create_tournament(context, owner_id, category, rounds, bank=question_handler.DEFAULT_BANK):
+    questions = bank.fetch_questions(category, rounds)
+    if not questions:
+        return None
+
+    tournament_id = secrets.token_hex(3)
+    tournament = Tournament(tournament_id, owner_id, category, rounds, questions)
+    _tournaments(context)[tournament_id] = tournament
+
+    # Cancelled by the first question via _cancel_job once the tournament starts
+    tournament.job = context.job_queue.run_once(
+        expire_tournament, LOBBY_TTL, data={"tournament_id": tournament_id}
+    )
+    return tournament
+
+
+async def expire_tournament(context):
+    """Drops a tournament nobody started so its chats aren't locked out of /start."""
+    tournament = get_tournament(context, context.job.data["tournament_id"])
+    if not tournament or tournament.started:
+        return
+
+    _tournaments(context).pop(tournament.id, None)
+    for chat_id in tournament.chat_ids:
+        context.application.chat_data.get(chat_id, {}).pop("tournament_id", None)
+
+    await broadcast(context.bot, tournament.chat_ids, f"⌛ Tournament {tournament.id} was never started and has expired.")
+
+
+def join_tournament(context, tournament, chat_id):
+    if tournament.started:
+        return False
+    tournament.chat_ids.add(chat_id)
+    context.application.chat_data[chat_id]["tournament_id"] = tournament.id
+    return True
+
+
+def leave_tournament(context, tournament, chat_id):
+    tournament.chat_ids.discard(chat_id)
+    context.application.chat_data.get(chat_id, {}).pop("tournament_id", None)
+
+
+async def broadcast(bot, chat_ids, text, **kwargs):
+    """
+    Sends the same message to every chat with at most SEND_CONCURRENCY requests in flight.
+    Flood-control (429) responses are waited out and retried. Returns the chats
+    the bot can no longer reach (blocked / removed) so callers can drop them.
+    """
+    semaphore = asyncio.Semaphore(SEND_CONCURRENCY)
+    unreachable = set()
+
+    async def send(chat_id):
+        for attempt in range(SEND_ATTEMPTS):
+            try:
+                async with semaphore:
+                    await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                return
+            except RetryAfter as e:
+                # Sleep outside the semaphore so other chats keep flowing
+                logger.warning(f"Tournament send to chat {chat_id} rate limited, retrying in {e.retry_after}s")
+                await asyncio.sleep(e.retry_after)
+            except Forbidden as e:
+                logger.warning(f"Tournament chat {chat_id} unreachable, dropping: {e}")
+                unreachable.add(chat_id)
+                return
+            except TelegramError as e:
+                logger.warning(f"Tournament send to chat {chat_id} failed: {e}")
+                return
+        logger.warning(f"Tournament send to chat {chat_id} gave up after {SEND_ATTEMPTS} attempts")
+
+    await asyncio.gather(*(send(chat_id) for chat_id in chat_ids))
+    return unreachable
+
+
+async def _broadcast(context, tournament, chat_ids, text, **kwargs):
+    # Unreachable chats leave the tournament so rounds can still close early
+    for chat_id in await broadcast(context.bot, chat_ids, text, **kwargs):
+        leave_tournament(context, tournament, chat_id)
+
+
+def _cancel_job(tournament):
+    if tournament.job:
+        try:
+            tournament.job.schedule_removal()
+        except JobLookupError:
+            pass
+    tournament.job = None
+
+
+def _schedule_tick(context, tournament, step, delay):
+    tournament.job = context.job_queue.run_once(
+        tournament_tick,
+        delay,
+        data={"tournament_id": tournament.id, "question": tournament.current_question, "step": step},
+    )
+
+
+def start_tournament(context, tournament):
+    tournament.started = True
+    _schedule_next_question(context, tournament)
+
+
+def _schedule_next_question(context, tournament):
+    # Fan-out runs as a job so the update handler returns right away instead of
+    # holding up every other chat's updates for the whole broadcast
+    context.job_queue.run_once(
+        next_question_job,
+        0,
+        data={"tournament_id": tournament.id, "question": tournament.current_question},
+    )
+
+
+async def next_question_job(context):
+    data = context.job.data
+    tournament = get_tournament(context, data["tournament_id"])
+    if not tournament or tournament.current_question != data["question"]:
+        return
+    await ask_tournament_question(context, tournament)
+
+
+@timed
+async def ask_tournament_question(context, tournament):
+    _cancel_job(tournament)
+
+    current = tournament.current_question
+    if current >= tournament.rounds:
+        await end_tournament(context, tournament)
+        return
+
+    q = tournament.questions[current]
+    tournament.correct_answer = q["correct_answer"]
+    tournament.hint_level = 0
+    tournament.answered_chats = set()
+    tournament.accepting = True
+
+    await _broadcast(
+        context,
+        tournament,
+        set(tournament.chat_ids),
+        question_handler.question_text(
+            q, current, tournament.rounds, prefix="🏟", title=f"Tournament {tournament.id} — Question"
+        ),
+        parse_mode="HTML",
+    )
+
+    _schedule_tick(context, tournament, 0, HINT_DELAYS[0])
+
+
+@timed
+async def tournament_tick(context):
+    """Shared timer for all chats: hint steps followed by the timeout."""
+    data = context.job.data
+    tournament = get_tournament(context, data["tournament_id"])
+    if not tournament or tournament.current_question != data["question"] or not tournament.accepting:
+        return
+
+    step = data["step"]
+    if step < len(HINT_DELAYS):
+        level = step + 1
+        next_delay = (HINT_DELAYS[step + 1] if step + 1 < len(HINT_DELAYS) else QUESTION_TIMEOUT) - HINT_DELAYS[step]
+        _schedule_tick(context, tournament, step + 1, next_delay)
+        await _send_hint(context, tournament, level)
+        return
+
+    # Timeout
+    tournament.job = None
+    tournament.accepting = False
+    pending = tournament.chat_ids - tournament.answered_chats
+    await _broadcast(
+        context,
+        tournament,
+        pending,
+        tournament.questions[tournament.current_question]["html_timeout"],
+        parse_mode="HTML",
+    )
+    tournament.current_question += 1
+    await ask_tournament_question(context, tournament)
+
+
+async def _send_hint(context, tournament, level):
+    hint_text = question_handler.render_hint(tournament.questions[tournament.current_question], level)
+    if not hint_text:
+        return
+
+    tournament.hint_level = level
+    await _broadcast(
+        context,
+        tournament,
+        tournament.chat_ids - tournament.answered_chats,
+        hint_text,
+        parse_mode="HTML",
+    )
+
+
+@timed
+async def handle_tournament_answer(update, context, tournament):
+    """First correct answer in each chat scores; the question closes once every chat has answered."""
+    chat_id = update.effective_chat.id
+    if not tournament.accepting or chat_id in tournament.answered_chats:
+        return
+
+    if update.message.text.strip().lower() != tournament.correct_answer:
+        return
+
+    tournament.answered_chats.add(chat_id)
+    score = SCORE_MAP.get(tournament.hint_level, 1)
+    user = update.effective_user
+
+    key = (user.id, chat_id)
+    if key not in tournament.scores:
+        tournament.scores[key] = {
+            "username": user.username or "",
+            "first_name": user.first_name or "",
+            "last_name": user.last_name or "",
+            "score": 0,
+        }
+    tournament.scores[key]["score"] += score
+
+    all_answered = tournament.answered_chats >= tournament.chat_ids
+    if all_answered:
+        tournament.accepting = False
+
+    await update.message.reply_text(
+        f"🎉 @{user.username or user.first_name} got it right!\n"
+        f"✅ Answer: {tournament.correct_answer}\n"
+        f"🏅 Points: {score}\n"
+    )
+
+    if all_answered:
+        tournament.current_question += 1
+        _schedule_next_question(context, tournament)
+
+
+@timed
+async def end_tournament(context, tournament):
+    _cancel_job(tournament)
+    tournament.accepting = False
+    _tournaments(context).pop(tournament.id, None)
+    for chat_id in tournament.chat_ids:
+        context.application.chat_data.get(chat_id, {}).pop("tournament_id", None)
+
+    if not tournament.scores:
+        await broadcast(context.bot, tournament.chat_ids, f"🛑 Tournament {tournament.id} ended. No one scored any points!")
+        return
+
+    # Combine per-user totals across chats for the scoreboard
+    totals = {}
+    for (user_id, _), data in tournament.scores.items():
+        entry = totals.setdefault(user_id, dict(data, score=0))
+        entry["score"] += data["score"]
+
+    sorted_totals = sorted(totals.items(), key=lambda x: x[1]["score"], reverse=True)
+    top_score = sorted_totals[0][1]["score"]
+    winners = {user_id for user_id, data in sorted_totals if data["score"] == top_score}
+
+    lines = []
+    for user_id, data in sorted_totals:
+        display = data.get("username") or f"{data.get('first_name', '')} {data.get('last_name', '')}".strip()
+        score = data["score"]
+        prefix = "🏆" if user_id in winners else "🏅"
+        lines.append(f"{prefix} {display}: {score} point{'s' if score != 1 else ''}")
+
+    db = context.application.bot_data.get("db")
+    if db:
+        db.save_scores([
+            dict(data, user_id=user_id, chat_id=chat_id, is_winner=user_id in winners)
+            for (user_id, chat_id), data in tournament.scores.items()
+        ])
+
+    leaderboard_text = "\n".join(lines)
+    await broadcast(
+        context.bot,
+        tournament.chat_ids,
+        f"🎉 Tournament {tournament.id} complete!\n\n{leaderboard_text}\n\n📊 Check /leaderboard for all-time stats!",
+    )
@@ -1,19 +1,12 @@
 import os
+import re
+import csv
 import json
 import sys
-import gspread
-from google.oauth2.service_account import Credentials
-
-# === Auth ===
-service_account_info = json.loads(os.environ["GOOGLE_SERVICE_ACCOUNT_JSON"])
-creds = Credentials.from_service_account_info(
-    service_account_info,
-    scopes=["https://www.googleapis.com/auth/spreadsheets.readonly"]
-)
-client = gspread.authorize(creds)
-
-spreadsheet_id = os.environ["SPREADSHEET_ID"]
-sheet = client.open_by_key(spreadsheet_id)
+import zlib
+import random
+import argparse
+from collections import defaultdict
 
 # === Config ===
 TABS = ["verse_complete", "verse_identify", "trivia"]
@@ -28,12 +21,95 @@ VALID_TYPES = {
     "general_trivia",
 }
 
-questions = []
+# Near-duplicate detection (MinHash + LSH)
+SHINGLE_SIZE = 4          # character shingles over the normalized question
+LSH_BANDS = 32            # bands * rows = number of MinHash permutations
+LSH_ROWS = 3              # ~0.3 Jaccard is where buckets start to collide
+MINHASH_PRIME = (1 << 61) - 1
+DEFAULT_REPORT_THRESHOLD = 0.5
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build app/data/questions.json from the question sheets.")
+    parser.add_argument(
+        "--input",
+        help="Offline mode: read rows from an exported .json or .csv file instead of Google Sheets",
+    )
+    parser.add_argument(
+        "--language",
+        help="Build a language bank from the <tab>_<language> tabs into app/data/questions.<language>.json",
+    )
+    parser.add_argument("--output", help="Where to write the built JSON (default depends on --language)")
+    parser.add_argument("--check-only", action="store_true", help="Run validations only, do not write output")
+    parser.add_argument(
+        "--near-dupe-threshold",
+        type=float,
+        default=DEFAULT_REPORT_THRESHOLD,
+        help="Report question pairs with the same answer at or above this similarity (0-1)",
+    )
+    parser.add_argument(
+        "--fail-threshold",
+        type=float,
+        default=None,
+        help="Fail the build if any near-duplicate pair is at or above this similarity (0-1)",
+    )
+    return parser.parse_args()
+
+
+# === Sources ===
+def language_tabs(language=None):
+    return [f"{tab}_{language}" for tab in TABS] if language else TABS
+
+
+def output_path(language=None):
+    return f"app/data/questions.{language}.json" if language else "app/data/questions.json"
+
+
+def load_rows_from_sheets(language=None):
+    import gspread
+    from google.oauth2.service_account import Credentials
+
+    service_account_info = json.loads(os.environ["GOOGLE_SERVICE_ACCOUNT_JSON"])
+    creds = Credentials.from_service_account_info(
+        service_account_info,
+        scopes=["https://www.googleapis.com/auth/spreadsheets.readonly"]
+    )
+    client = gspread.authorize(creds)
+
+    spreadsheet_id = os.environ["SPREADSHEET_ID"]
+    sheet = client.open_by_key(spreadsheet_id)
+
+    rows = []
+    for tab_name in language_tabs(language):
+        ws = sheet.worksheet(tab_name)
+        rows.extend(ws.get_all_records())
+    return rows
+
+
+def load_rows_from_file(path):
+    """
+    Rows exported from the sheets (or a previously built questions.json).
+    Rows without an `approved` column are treated as approved.
+    """
+    if path.lower().endswith(".csv"):
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            rows = json.load(f)
+
+    for row in rows:
+        row.setdefault("approved", "Y")
+    return rows
+
 
 # === Collect questions ===
-for tab_name in TABS:
-    ws = sheet.worksheet(tab_name)
-    rows = ws.get_all_records()
+def s(v):
+    return "" if v is None else str(v).strip()
+
+
+def collect_questions(rows):
+    questions = []
 
     for row in rows:
         approved = str(row.get("approved", "")).strip().upper()
@@ -43,9 +119,6 @@ for tab_name in TABS:
         if approved != "Y" or qtype not in VALID_TYPES:
             continue
 
-        def s(v):
-            return "" if v is None else str(v).strip()
-
         q = {
             "type": s(qtype),
             "question": s(row.get("question")),
@@ -61,6 +134,9 @@ for tab_name in TABS:
 
         questions.append(q)
 
+    return questions
+
+
 # === Sort canonically ===
 def safe_int(val):
     try:
@@ -68,42 +144,184 @@ def safe_int(val):
     except (ValueError, TypeError):
         return 0
 
-questions.sort(
-    key=lambda q: (
-        q["type"],
-        safe_int(q["booknum"]),
-        safe_int(q["chapter"]),
-        safe_int(q["verse"]),
-        q["question"].lower(),
+
+def sort_questions(questions):
+    questions.sort(
+        key=lambda q: (
+            q["type"],
+            safe_int(q["booknum"]),
+            safe_int(q["chapter"]),
+            safe_int(q["verse"]),
+            q["question"].lower(),
+        )
     )
-)
-
-# === Validate UUID uniqueness ===
-uuids = [q["uuid"] for q in questions if q["uuid"]]
-dupes = sorted({u for u in uuids if uuids.count(u) > 1})
-
-if dupes:
-    print("❌ Duplicate UUIDs detected!")
-    for d in dupes:
-        print(f" - {d}")
-    print("❗ Please fix duplicates in the source sheets before re-running.")
-    sys.exit(1)
-
-# === Prepare JSON for output ===
-fields_to_keep = ["type", "question", "answer", "difficulty", "uuid"]
-
-# Remove unnecessary fields
-clean_questions = [
-    {k: q[k] for k in fields_to_keep}
-    for q in questions
-]
-
-# === Save combined JSON ===
-os.makedirs("app/data", exist_ok=True)
-out_path = "app/data/questions.json"
-with open(out_path, "w", encoding="utf-8") as f:
-    json.dump(clean_questions, f, ensure_ascii=False, indent=2)
-
-print(f"✅ Built {len(clean_questions)} approved questions from {TABS}")
-print(f"📘 Sorted by type → booknum → chapter → verse → question")
-print("🆔 All UUIDs unique ✔️")
+
+
+# === Near-duplicate detection ===
+def normalize_text(text):
+    """Lowercase, drop punctuation and collapse whitespace."""
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+def shingles(text, k=SHINGLE_SIZE):
+    text = normalize_text(text)
+    if len(text) <= k:
+        return {text}
+    return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def make_hash_params(num_perm, seed=1):
+    # Fixed seed so bucket assignment is reproducible between runs
+    rng = random.Random(seed)
+    return [(rng.randrange(1, MINHASH_PRIME), rng.randrange(0, MINHASH_PRIME)) for _ in range(num_perm)]
+
+
+def minhash_signature(shingle_set, hash_params):
+    # crc32 instead of hash() so signatures don't depend on PYTHONHASHSEED
+    hashed = [zlib.crc32(sh.encode("utf-8")) for sh in shingle_set]
+    return [min((a * h + b) % MINHASH_PRIME for h in hashed) for a, b in hash_params]
+
+
+def find_near_duplicates(questions, threshold=DEFAULT_REPORT_THRESHOLD):
+    """
+    Returns a list of clusters of questions sharing the same (normalized) answer
+    whose question text is at least `threshold` similar (Jaccard over shingles).
+    Each cluster is {"answer", "questions": [q, ...], "pairs": [(i, j, sim), ...]}.
+
+    Candidate pairs come from LSH buckets keyed by answer and signature band,
+    so only questions that collide are compared rather than every pair.
+    """
+    hash_params = make_hash_params(LSH_BANDS * LSH_ROWS)
+    shingle_sets = [shingles(q["question"]) for q in questions]
+    answers = [normalize_text(q["answer"]) for q in questions]
+
+    buckets = defaultdict(list)
+    for idx, sh in enumerate(shingle_sets):
+        sig = minhash_signature(sh, hash_params)
+        for band in range(LSH_BANDS):
+            key = (answers[idx], band, tuple(sig[band * LSH_ROWS:(band + 1) * LSH_ROWS]))
+            buckets[key].append(idx)
+
+    candidates = set()
+    for members in buckets.values():
+        for x in range(len(members)):
+            for y in range(x + 1, len(members)):
+                candidates.add((members[x], members[y]))
+
+    # Union-find over verified pairs
+    parent = list(range(len(questions)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    pairs = []
+    for i, j in sorted(candidates):
+        sim = jaccard(shingle_sets[i], shingle_sets[j])
+        if sim >= threshold:
+            pairs.append((i, j, sim))
+            parent[find(i)] = find(j)
+
+    grouped = defaultdict(lambda: {"members": set(), "pairs": []})
+    for i, j, sim in pairs:
+        group = grouped[find(i)]
+        group["members"].update((i, j))
+        group["pairs"].append((i, j, sim))
+
+    clusters = []
+    for group in grouped.values():
+        members = sorted(group["members"])
+        clusters.append({
+            "answer": questions[members[0]]["answer"],
+            "questions": [questions[m] for m in members],
+            "pairs": group["pairs"],
+        })
+    clusters.sort(key=lambda c: -max(sim for _, _, sim in c["pairs"]))
+    return clusters
+
+
+def report_near_duplicates(clusters):
+    print(f"⚠️ {len(clusters)} near-duplicate cluster(s) detected:")
+    for cluster in clusters:
+        top = max(sim for _, _, sim in cluster["pairs"])
+        print(f" - answer '{cluster['answer']}' (max similarity {top:.2f})")
+        for q in cluster["questions"]:
+            print(f"     [{q['uuid'] or 'no-uuid'}] {q['question']}")
+
+
+def main():
+    args = parse_args()
+
+    rows = load_rows_from_file(args.input) if args.input else load_rows_from_sheets(args.language)
+    source = args.input or language_tabs(args.language)
+    output = args.output or output_path(args.language)
+
+    questions = collect_questions(rows)
+    sort_questions(questions)
+
+    # === Validate UUID uniqueness ===
+    uuids = [q["uuid"] for q in questions if q["uuid"]]
+    dupes = sorted({u for u in uuids if uuids.count(u) > 1})
+
+    if dupes:
+        print("❌ Duplicate UUIDs detected!")
+        for d in dupes:
+            print(f" - {d}")
+        print("❗ Please fix duplicates in the source sheets before re-running.")
+        sys.exit(1)
+
+    # === Validate near-duplicate questions ===
+    report_threshold = args.near_dupe_threshold
+    if args.fail_threshold is not None:
+        report_threshold = min(report_threshold, args.fail_threshold)
+
+    clusters = find_near_duplicates(questions, threshold=report_threshold)
+    if clusters:
+        report_near_duplicates(clusters)
+
+    if args.fail_threshold is not None:
+        blocking = [
+            c for c in clusters
+            if any(sim >= args.fail_threshold for _, _, sim in c["pairs"])
+        ]
+        if blocking:
+            print(f"❌ {len(blocking)} cluster(s) at or above similarity {args.fail_threshold:.2f}!")
+            print("❗ Please reword or remove near-duplicate questions in the source sheets before re-running.")
+            sys.exit(1)
+
+    # === Prepare JSON for output ===
+    fields_to_keep = ["type", "question", "answer", "difficulty", "book", "uuid"]
+
+    # Remove unnecessary fields
+    clean_questions = [
+        {k: q[k] for k in fields_to_keep}
+        for q in questions
+    ]
+
+    if args.check_only:
+        print(f"✅ Checked {len(clean_questions)} approved questions from {source}")
+        return
+
+    # === Save combined JSON ===
+    out_dir = os.path.dirname(output)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(clean_questions, f, ensure_ascii=False, indent=2)
+
+    print(f"✅ Built {len(clean_questions)} approved questions from {source}")
+    print(f"📘 Sorted by type → booknum → chapter → verse → question")
+    print("🆔 All UUIDs unique ✔️")
+
+
+if __name__ == "__main__":
+    main()